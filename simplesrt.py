@@ -1,7 +1,9 @@
 import os
+import bisect
 from datetime import timedelta
 from typing import List, Tuple, Union, Iterator
 import re
+import time
 
 
 class Subtitle:
@@ -130,75 +132,188 @@ class SimpleSrt:
             else:
                 i += 1
 
-def dedupe_yt_srt(subs_iter):
+def dedupe_yt_action(previous_subtitle, subtitle):
+    """
+    Decides which dedupe rule of dedupe_yt_srt applies to a subtitle, without changing anything.
+    The decision only depends on the texts, so it can be reused for translations with the same timing.
+
+    :param previous_subtitle: the last subtitle that is not finished yet, None for the first subtitle
+    :param subtitle: the next subtitle, with stripped text
+    :return: one of "first", "skip", "extend", "append", "join", "cut" or "keep"
+    """
+    if previous_subtitle is None: # first interation set previous subtitle for comparison
+        return "first"
+
+    if len(subtitle.text) == 0:  # skip over empty subtitles
+        return "skip"
+
+    if (subtitle.start - subtitle.end < timedelta(milliseconds=150) and # very short
+                    subtitle.text in previous_subtitle.text ): # same text as previous
+        return "extend"
+
+    current_lines = subtitle.text.split("\n")
+    last_lines = previous_subtitle.text.split("\n")
+
+    if current_lines[0] == last_lines[-1]: # if first current is  last previous
+        if len(last_lines)==1 and len(last_lines[0].split(" "))<2 and len(last_lines[0])>2: # if  is just one word
+            return "join"
+        return "cut"
+
+    if len(subtitle.text.split(" "))<=2: # only one word in subtitle
+        return "append"
+    return "keep"
+
+
+def dedupe_yt_step(previous_subtitle, subtitle, action=None):
+    """
+    Applies the dedupe rules of dedupe_yt_srt to a single subtitle.
+    previous_subtitle and subtitle may both be modified.
+
+    :param previous_subtitle: the last subtitle that is not finished yet, None for the first subtitle
+    :param subtitle: the next subtitle
+    :param action: rule to apply as returned by dedupe_yt_action, decided from the texts if None
+    :return: tuple of the finished subtitle (or None) and the subtitle to compare the next one with
+    """
+    if previous_subtitle is None:
+        return None, subtitle
+
+    subtitle.text = subtitle.text.strip() # remove trailing linebreaks
+    if action is None:
+        action = dedupe_yt_action(previous_subtitle, subtitle)
+
+    if action == "skip":
+        return None, previous_subtitle
+
+    if action == "extend":
+        previous_subtitle.end = subtitle.end # lengthen previous subtitle
+        return None, previous_subtitle
+
+    if action == "append":
+        previous_subtitle.end = subtitle.end # lengthen previous subtitle
+        title_text=subtitle.text
+        if title_text[0]!=" ":
+            title_text=" "+title_text
+
+        previous_subtitle.text+=title_text # add text to previous
+        return None, previous_subtitle # drop this subtitle
+
+    current_lines = subtitle.text.split("\n")
+    if action == "join":
+        subtitle.text= current_lines[0]+" "+"\n".join(current_lines[1:]) # remove line break after single word
+    elif action == "cut":
+        subtitle.text = "\n".join(current_lines[1:]) # discard first line of current
+
+    if subtitle.start <= previous_subtitle.end: # remove overlap and let 1ms gap
+        previous_subtitle.end = subtitle.start - timedelta(milliseconds=1)
+
+    if subtitle.start >= subtitle.end: # swap start and end if wrong order
+        end =subtitle.end
+        subtitle.end= subtitle.start
+        subtitle.start = end
+
+    if action == "join": # previous single word is now the start of this subtitle
+        return None, subtitle
+    return previous_subtitle, subtitle
+
+
+def dedupe_yt_srt(subs_iter, actions=None):
+    """
+    Removes the rolling duplicate lines of YouTube auto generated subtitles and fixes their timing.
+
+    :param subs_iter: iterable of Subtitle objects
+    :param actions: list the decided dedupe_yt_action of every subtitle is appended to, for replay_yt_texts
+    :return: generator of the fixed Subtitle objects
+    """
     previous_subtitle = None
-    index = 1
-    text = ""
     for subtitle in subs_iter:
+        if previous_subtitle is not None:
+            subtitle.text = subtitle.text.strip() # remove trailing linebreaks
+        action = dedupe_yt_action(previous_subtitle, subtitle)
+        if actions is not None:
+            actions.append(action)
+        finished_subtitle, previous_subtitle = dedupe_yt_step(previous_subtitle, subtitle, action)
+        if finished_subtitle is not None:
+            yield finished_subtitle
+    if previous_subtitle is not None:
+        yield previous_subtitle
 
 
-        if previous_subtitle is None: # first interation set previous subtitle for comparison
-             previous_subtitle = subtitle
-             continue
+srt_cue_pattern = re.compile(r"^[ \t]*(\d+:\d+:\d+,\d+ --> \d+:\d+:\d+,\d+)[^\n]*", re.MULTILINE)
 
-        subtitle.text = subtitle.text.strip() # remove trailing linebreaks
 
+def split_srt_cues(subtitle_text):
+    """
+    Splits srt text into the timecode lines and the texts of the cues, like SimpleSrt without parsing the times.
 
+    :param subtitle_text: srt text
+    :return: tuple of the list of timecode strings and the list of stripped cue texts
+    """
+    matches = list(srt_cue_pattern.finditer(subtitle_text))
+    timecodes = [match.group(1) for match in matches]
+    texts = []
+    for i, match in enumerate(matches):
+        last = i + 1 == len(matches)
+        block = subtitle_text[match.end():len(subtitle_text) if last else matches[i + 1].start()]
+        lines = [x for x in block.split("\n") if len(x.strip()) > 0]
+        if not last:
+            lines = lines[:-1]  # index of the next cue
+        texts.append("\n".join(lines).strip())
+    return timecodes, texts
+
+
+def replay_yt_texts(texts, actions):
+    """
+    Applies the actions dedupe_yt_srt recorded for another track with the same timing to the texts of a track,
+    like the automatic translations of YouTube subtitles. Only the texts are handled, the fixed timing
+    is the one of the other track.
+    Raises ValueError if a text doesn't fit its action, the track has to be fixed on its own then.
+
+    :param texts: cue texts as returned by split_srt_cues
+    :param actions: list of actions recorded by dedupe_yt_srt
+    :return: list of the fixed texts, one for every subtitle dedupe_yt_srt returned for the other track
+    """
+    if len(texts) != len(actions):
+        raise ValueError("number of subtitles and recorded actions differ")
+
+    fixed_texts = []
+    previous_text = None
+    for text, action in zip(texts, actions):
+        if action == "first":
+            previous_text = text
+            continue
 
-        if len(subtitle.text) == 0:  # skip over empty subtitles
+        if action == "skip":
+            if len(text) > 0:
+                raise ValueError(f"'{text}' is not empty")
             continue
 
-        if (subtitle.start - subtitle.end < timedelta(milliseconds=150) and # very short
-                        subtitle.text in previous_subtitle.text ): # same text as previous
-            previous_subtitle.end = subtitle.end # lengthen previous subtitle
+        if action == "extend":
+            if text not in previous_text:
+                raise ValueError(f"'{text}' is not part of '{previous_text}'")
             continue
-        
-
-     
-        
-
-
-        current_lines = subtitle.text.split("\n")
-        last_lines = previous_subtitle.text.split("\n")
-
-        singleword=False
-
-        if current_lines[0] == last_lines[-1]: # if first current is  last previous
-            if len(last_lines)==1:
-                if  len(last_lines[0].split(" "))<2 and len(last_lines[0])>2: # if  is just one word            
-                    singleword=True
-                    subtitle.text= current_lines[0]+" "+"\n".join(current_lines[1:]) # remove line break after single word
-  
-                else:
-                    subtitle.text = "\n".join(current_lines[1:]) # discard first line of current            
-            else:        
-                subtitle.text = "\n".join(current_lines[1:]) # discard first line of current
-        else: # not fusing two lines
-            if len(subtitle.text.split(" "))<=2: # only one word in subtitle
-         
-                previous_subtitle.end = subtitle.end # lengthen previous subtitle
-                title_text=subtitle.text
-                if title_text[0]!=" ":
-                    title_text=" "+title_text
-
-                previous_subtitle.text+=title_text # add text to previous
-                continue # drop this subtitle
-
-
-        if subtitle.start <= previous_subtitle.end: # remove overlap and let 1ms gap
-            previous_subtitle.end = subtitle.start - timedelta(milliseconds=1)
-
-        if subtitle.start >= subtitle.end: # swap start and end if wrong order
-            end =subtitle.end 
-            subtitle.end= subtitle.start
-            subtitle.start = end
-            
-
-        if not singleword:
-            yield previous_subtitle
-        previous_subtitle = subtitle
-        index += 1
-    yield previous_subtitle
+
+        if action == "append":
+            if len(text) == 0:
+                raise ValueError(f"can't append an empty subtitle to '{previous_text}'")
+            previous_text += " " + text
+            continue
+
+        current_lines = text.split("\n")
+        if action in ("cut", "join"):
+            if current_lines[0] != previous_text.split("\n")[-1]:
+                raise ValueError(f"'{current_lines[0]}' doesn't repeat the last line of '{previous_text}'")
+            if action == "cut":
+                text = "\n".join(current_lines[1:])
+            else:
+                text = current_lines[0] + " " + "\n".join(current_lines[1:])
+
+        if action != "join":
+            fixed_texts.append(previous_text)
+        previous_text = text
+
+    if previous_text is not None:
+        fixed_texts.append(previous_text)
+    return fixed_texts
 
 
 def subs_to_text(subs_iter):
@@ -214,13 +329,322 @@ def subs_to_text(subs_iter):
     return text
 
 
-def process_srt(file_path, new_file_path):
-    text = ""
-    with open(file_path, "r", encoding="utf8") as file:
-        srtstring = file.read()
-        srt = SimpleSrt(srtstring)
-        subs = dedupe_yt_srt(srt.subs)
-        text=subs_to_text(subs)
+yt_timecode_pattern = r"(\d+):(\d+):(\d+)[,.](\d+) --> (\d+):(\d+):(\d+)[,.](\d+)"
+yt_timecode_patterns = {str: re.compile(yt_timecode_pattern), bytes: re.compile(yt_timecode_pattern.encode())}
+
+
+def _first_and_last_line(text, newline):
+    lines = [line.strip() for line in text.split(newline)]
+    lines = [line for line in lines if line]
+    if lines and lines[-1].isdigit():  # index of the next cue
+        lines.pop()
+    if not lines:
+        return None, None
+    return lines[0], lines[-1]
+
+
+def _scan_cues(data):
+    # yields start and end in ms, first and last text line of every cue, without building Subtitle objects
+    pattern = yt_timecode_patterns[type(data)]
+    newline = b"\n" if isinstance(data, bytes) else "\n"
+    cue = None  # start, end and text position of the last timecode
+    for match in pattern.finditer(data):
+        if cue:
+            yield (cue[0], cue[1]) + _first_and_last_line(data[cue[2]:match.start()], newline)
+        h1, m1, s1, ms1, h2, m2, s2, ms2 = [int(x) for x in match.groups()]
+        cue = ((h1 * 3600 + m1 * 60 + s1) * 1000 + ms1, (h2 * 3600 + m2 * 60 + s2) * 1000 + ms2, match.end())
+    if cue:
+        yield (cue[0], cue[1]) + _first_and_last_line(data[cue[2]:], newline)
+
+
+def scan_yt_srt(data, min_hits=2):
+    """
+    Checks the raw subtitle text for the signatures of YouTube auto generated subtitles:
+    cues of about 10ms, the first line of a cue repeating the last line of the previous cue
+    and overlapping timecodes. Stops as soon as min_hits signatures are found.
+
+    :param data: srt text as str or bytes
+    :param min_hits: number of signatures needed to consider the subtitles broken
+    :return: True if the subtitles need fixing, False if they are clean
+    """
+    hits = 0
+    previous_end = None
+    previous_last_line = None
+    for start, end, first_line, last_line in _scan_cues(data):
+        if end - start <= 50:  # very short
+            hits += 1
+        if previous_end is not None and start < previous_end:  # overlap
+            hits += 1
+        if first_line is not None and first_line == previous_last_line:  # rolling duplicate line
+            hits += 1
+        if hits >= min_hits:
+            return True
+        previous_end = end
+        previous_last_line = last_line
+    return False
+
+
+def _to_ms(duration):
+    return duration // timedelta(milliseconds=1)
+
+
+class SubtitleTrack:
+    """
+        A time-indexed list of subtitles for fast lookups and clip extraction.
+
+        Build it once from the output of dedupe_yt_srt, then cut as many clips as needed.
+        Every lookup is a bisect on the sorted start times, so a clip costs O(log n + k)
+        instead of a full pass over the subtitles.
+
+        Attributes
+        ----------
+        subs : List[Subtitle]
+            The subtitles sorted by start time.
+
+        Methods
+        -------
+        at(t_ms: int) -> Union[Subtitle, None]:
+            Returns the subtitle shown at t_ms milliseconds, or None.
+
+        slice(start_ms: int, end_ms: Optional[int], rebase: bool = True) -> List[Subtitle]:
+            Returns the subtitles overlapping the clip from start_ms to end_ms (None for the end of the track),
+            with times rebased to the clip start if rebase is True.
+
+        Usage
+        -----
+        track = SubtitleTrack(dedupe_yt_srt(SimpleSrt(srt_string).subs))
+        clip = subs_to_text(track.slice(60000, 90000))
+    """
+
+    def __init__(self, subs_iter):
+        self.subs = sorted((subtitle for subtitle in subs_iter if subtitle is not None), key=lambda subtitle: subtitle.start)
+        self._starts = [_to_ms(subtitle.start) for subtitle in self.subs]
+
+        # running maximum of the end times, sorted even if some subtitles overlap
+        self._max_ends = []
+        max_end = None
+        for subtitle in self.subs:
+            end = _to_ms(subtitle.end)
+            if max_end is None or end > max_end:
+                max_end = end
+            self._max_ends.append(max_end)
+
+    def __len__(self):
+        return len(self.subs)
+
+    def __iter__(self):
+        return iter(self.subs)
+
+    def at(self, t_ms):
+        """
+        Returns the subtitle shown at t_ms milliseconds, or None if there is none.
+        If several subtitles overlap t_ms, the one that started last is returned.
+
+        :param t_ms: time in milliseconds
+        :return: Subtitle or None
+        """
+        i = bisect.bisect_right(self._starts, t_ms)
+        lowest = bisect.bisect_right(self._max_ends, t_ms)
+        while i > lowest:
+            i -= 1
+            if _to_ms(self.subs[i].end) > t_ms:
+                return self.subs[i]
+        return None
+
+    def slice(self, start_ms, end_ms, rebase=True):
+        """
+        Returns the subtitles overlapping the clip from start_ms to end_ms, or to the end of the track if end_ms is None.
+        With rebase the returned subtitles are copies whose times are relative to start_ms
+        and clamped to the clip, the subtitles of the track are never modified.
+
+        :param start_ms: clip start in milliseconds
+        :param end_ms: clip end in milliseconds, None for the end of the track
+        :param rebase: shift the times so the clip starts at 0
+        :return: list of Subtitle objects
+        """
+        lo = bisect.bisect_right(self._max_ends, start_ms)
+        hi = len(self.subs) if end_ms is None else bisect.bisect_left(self._starts, end_ms)
+        clip = [subtitle for subtitle in self.subs[lo:hi] if _to_ms(subtitle.end) > start_ms]
+        if not rebase:
+            return clip
+
+        offset = timedelta(milliseconds=start_ms)
+        length = None if end_ms is None else timedelta(milliseconds=end_ms - start_ms)
+        return [Subtitle(max(subtitle.start - offset, timedelta(0)),
+                         subtitle.end - offset if length is None else min(subtitle.end - offset, length),
+                         subtitle.text)
+                for subtitle in clip]
+
+
+class LiveSrtFixer:
+    """
+        Fixes the subtitles of a live stream incrementally while the SRT or VTT text arrives in chunks.
+
+        Only the incomplete last line, the cue being read and the last subtitle are kept, so memory
+        stays constant for streams of any length. The last subtitle is finished when the next one arrives,
+        or forced out once it has waited max_latency seconds. A subtitle that was forced out is not changed
+        anymore, so the dedupe rules are applied to a copy of it.
+
+        Methods
+        -------
+        feed(chunk: str) -> str:
+            Reads a chunk of SRT or VTT text and returns the finished subtitles as SRT text.
+        poll() -> str:
+            Returns the last subtitle as SRT text if it has waited longer than max_latency.
+        close() -> str:
+            Ends the stream and returns the remaining subtitles as SRT text.
+
+        Usage
+        -----
+        fixer = LiveSrtFixer(max_latency=3)
+        for chunk in stream:
+            output.write(fixer.feed(chunk))
+        output.write(fixer.close())
+    """
+
+    timecode_pattern = re.compile(r"(?:(\d+):)?(\d+):(\d+)[,.](\d+) --> (?:(\d+):)?(\d+):(\d+)[,.](\d+)")
+    tag_pattern = re.compile(r"<[^>]*>")  # vtt word timings and styling like <00:00:01.234><c> word</c>
+
+    def __init__(self, max_latency=5.0, clock=time.monotonic):
+        self.max_latency = max_latency
+        self.clock = clock
+        self._buffer = ""  # incomplete last line
+        self._cue = None  # start and end of the cue being read
+        self._cue_lines = []
+        self._previous = None  # last subtitle, changes until the next one arrives
+        self._previous_since = None
+        self._previous_emitted = False
+        self._index = 1
+
+    def feed(self, chunk):
+        """
+        Reads a chunk of SRT or VTT text, chunks may end anywhere, even in the middle of a line.
+
+        :param chunk: the next part of the subtitle text
+        :return: SRT text of the subtitles that are finished, empty if there are none
+        """
+        finished = []
+        self._expire(finished)  # a late subtitle goes out before the new lines can change it
+        *lines, self._buffer = (self._buffer + chunk).split("\n")
+        for line in lines:
+            self._read_line(line, finished)
+        self._expire(finished)
+        return self._to_text(finished)
+
+    def poll(self):
+        """
+        Forces out the last subtitle if it has waited longer than max_latency, call it regularly
+        when no new chunks arrive.
+
+        :return: SRT text of the last subtitle, empty if it is not due yet
+        """
+        finished = []
+        self._expire(finished)
+        return self._to_text(finished)
+
+    def close(self):
+        """
+        Ends the stream, the fixer can't be fed afterwards.
+
+        :return: SRT text of all remaining subtitles
+        """
+        finished = []
+        self._read_line(self._buffer, finished)
+        self._buffer = ""
+        self._end_cue(finished)
+        if self._previous is not None and not self._previous_emitted:
+            finished.append(self._previous)
+        self._previous = None
+        return self._to_text(finished)
+
+    def _parse_timecode(self, line):
+        if "-->" not in line:
+            return False
+        timing = self.timecode_pattern.match(line.strip())
+        if timing is None:
+            return False
+        parts = [int(x or 0) for x in timing.groups()]  # vtt hours are optional
+        return SimpleSrt.get_duration(parts[0:4]), SimpleSrt.get_duration(parts[4:8])
+
+    def _read_line(self, line, finished):
+        line = line.rstrip("\r")
+        timecode = self._parse_timecode(line)
+        if timecode:
+            self._end_cue(finished)
+            self._cue = timecode
+        elif line == "":
+            self._end_cue(finished)
+        elif self._cue is not None:
+            text = self.tag_pattern.sub("", line)
+            if len(text.strip()) > 0:  # youtube vtt has lines with a single space inside cues
+                self._cue_lines.append(text)
+        # lines outside of a cue are srt indexes, the vtt header or NOTE and STYLE blocks
+
+    def _end_cue(self, finished):
+        if self._cue is None:
+            return
+        start, end = self._cue
+        subtitle = Subtitle(start, end, "\n".join(self._cue_lines))
+        self._cue = None
+        self._cue_lines = []
+
+        if self._previous_emitted:
+            reference = Subtitle(self._previous.start, self._previous.end, self._previous.text)
+            action = dedupe_yt_action(reference, subtitle)
+            if action == "join":  # the single word is already out, drop it instead of starting with it again
+                action = "cut"
+            _, previous = dedupe_yt_step(reference, subtitle, action)
+            if previous is reference:
+                if reference.text == self._previous.text:  # repeated text of the emitted subtitle
+                    return
+                # "append": too late to add the word to the emitted subtitle, so it becomes a subtitle of its own
+                previous = subtitle
+        else:
+            finished_subtitle, previous = dedupe_yt_step(self._previous, subtitle)
+            if finished_subtitle is not None:
+                finished.append(finished_subtitle)
+
+        if previous is not self._previous:
+            self._previous = previous
+            self._previous_since = self.clock()
+            self._previous_emitted = False
+
+    def _expire(self, finished):
+        if (self._previous is not None and not self._previous_emitted
+                and self.clock() - self._previous_since >= self.max_latency):
+            finished.append(self._previous)
+            self._previous_emitted = True
+
+    def _to_text(self, finished):
+        text = ""
+        for subtitle in finished:
+            text += f"{self._index}\n{subtitle}"  # numbering continues over the whole stream
+            self._index += 1
+        return text
+
+
+def process_srt(file_path, new_file_path, skip_clean=False):
+    """
+    Fixes a srt file and saves it as new_file_path.
+
+    :param file_path: srt file to fix
+    :param new_file_path: path of the fixed srt file
+    :param skip_clean: copy files without YouTube duplicates unchanged instead of fixing them
+    :return: True if the file was fixed, False if it was copied unchanged
+    """
+    with open(file_path, "rb") as file:
+        data = file.read()
+
+    if skip_clean and not scan_yt_srt(data):
+        with open(new_file_path, "wb") as new_file:
+            new_file.write(data)
+        return False
+
+    srtstring = data.decode("utf8").replace("\r\n", "\n").replace("\r", "\n")
+    srt = SimpleSrt(srtstring)
+    subs = dedupe_yt_srt(srt.subs)
+    text=subs_to_text(subs)
 
     with open(new_file_path, "w", encoding="utf8") as new_file:
         new_file.write(text.strip())
+    return True
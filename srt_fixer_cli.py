@@ -4,7 +4,7 @@ from argparse import ArgumentParser
 
 import argparse
 import os
-from simplesrt import process_srt
+from simplesrt import process_srt, scan_yt_srt
 
 
 # nice progressbar via tqdm
@@ -15,12 +15,21 @@ try:
 except ModuleNotFoundError:
     TQDM_INSTALLED = False
 
+
+def print_check(file_path):
+    with open(file_path, "rb") as file:
+        needs_fix = scan_yt_srt(file.read())
+    print(f"{file_path}: {'needs fixing' if needs_fix else 'clean'}")
+
+
 def main():
     parser: ArgumentParser = argparse.ArgumentParser(description="fix duplicate lines in srt converted youtube auto generated subtitles")
     parser.add_argument("input", nargs="?", help="Input subtitle file.")
     parser.add_argument("-o", "--output", help="Output subtitle file.")
     parser.add_argument("-idir", "--input-directory", help="Input directory containing subtitle files.")
     parser.add_argument("-odir", "--output-directory", help='Output directory for processed subtitle files.')
+    parser.add_argument("--check", action="store_true", help="Only report which subtitle files need fixing, don't write anything.")
+    parser.add_argument("--skip-clean", action="store_true", help="Copy subtitle files without YouTube duplicates unchanged instead of fixing them.")
     args = parser.parse_args()
     input_directory = args.input_directory
     output_directory = args.output_directory
@@ -35,6 +44,12 @@ def main():
             print(f"Input directory '{input_directory}' does not exist or is not accessible.")
             return
 
+        if args.check:
+            for file in os.listdir(input_directory):
+                if file.endswith(".srt"):
+                    print_check(os.path.join(input_directory, file))
+            return
+
         if not output_directory:
             output_directory = input_directory
 
@@ -54,20 +69,24 @@ def main():
                 if file.endswith(".srt"):
                     file_path = os.path.join(input_directory, file)
                     new_file_path = os.path.join(output_directory, file[:-4] + ".fixed.srt")
-                    process_srt(file_path, new_file_path)
+                    process_srt(file_path, new_file_path, args.skip_clean)
         else:
             for file in tqdm(os.listdir(input_directory), desc="Processing SRT files", unit="file",
                              bar_format='{l_bar}{bar:10}{r_bar}{bar:-10b}'):
                 if file.endswith(".srt"):
                     file_path = os.path.join(input_directory, file)
                     new_file_path = os.path.join(output_directory, file[:-4] + ".fixed.srt")
-                    process_srt(file_path, new_file_path)
+                    process_srt(file_path, new_file_path, args.skip_clean)
     else:
         file_path = str(args.input)
         if not file_path or not os.path.isfile(file_path):
             print(f"Input file '{file_path}' does not exist or is not accessible.")
             return
 
+        if args.check:
+            print_check(file_path)
+            return
+
         if not output_file and output_directory:
             new_file_path = os.path.join(output_directory,file_path[:-4] + ".fixed.srt")
         elif os.path.isdir(output_file):
@@ -76,7 +95,7 @@ def main():
         else:
             new_file_path = output_file or file_path[:-4] + ".fixed.srt"
 
-        process_srt(file_path, new_file_path)
+        process_srt(file_path, new_file_path, args.skip_clean)
 
 
 
@@ -0,0 +1,80 @@
+import unittest
+
+from simplesrt import LiveSrtFixer, SimpleSrt, dedupe_yt_srt, subs_to_text
+
+# youtube auto caption vtt, with the single space lines at the start of a cue after silence
+# and as second line of the 10ms cues
+YOUTUBE_VTT = ("WEBVTT\nKind: captions\nLanguage: en\n\n"
+               "00:00:00.030 --> 00:00:02.629 align:start position:0%\n"
+               " \n"
+               "hi<00:00:00.240><c> everyone</c><00:00:00.840><c> welcome</c>\n\n"
+               "00:00:02.629 --> 00:00:02.639 align:start position:0%\n"
+               "hi everyone welcome\n"
+               " \n\n"
+               "00:00:02.639 --> 00:00:05.190 align:start position:0%\n"
+               "hi everyone welcome\n"
+               "to<00:00:02.879><c> the</c><00:00:03.120><c> channel</c>\n\n"
+               "00:00:05.190 --> 00:00:05.200 align:start position:0%\n"
+               "to the channel\n"
+               " \n\n"
+               "00:00:05.200 --> 00:00:07.000 align:start position:0%\n"
+               "to the channel\n"
+               "today<00:00:05.500><c> we</c><00:00:05.800><c> talk</c><00:00:06.000><c> about</c>\n")
+
+# the same cues as srt
+YOUTUBE_SRT = """1
+00:00:00,030 --> 00:00:02,629
+hi everyone welcome
+
+2
+00:00:02,629 --> 00:00:02,639
+hi everyone welcome
+
+3
+00:00:02,639 --> 00:00:05,190
+hi everyone welcome
+to the channel
+
+4
+00:00:05,190 --> 00:00:05,200
+to the channel
+
+5
+00:00:05,200 --> 00:00:07,000
+to the channel
+today we talk about
+"""
+
+
+class LiveSrtFixerTest(unittest.TestCase):
+
+    def test_youtube_vtt_matches_dedupe(self):
+        expected = subs_to_text(dedupe_yt_srt(SimpleSrt(YOUTUBE_SRT).subs))
+        self.assertEqual(expected,
+                         "1\n00:00:00,030 --> 00:00:02,638\nhi everyone welcome\n\n"
+                         "2\n00:00:02,639 --> 00:00:05,199\nto the channel\n\n"
+                         "3\n00:00:05,200 --> 00:00:07,000\ntoday we talk about\n\n")
+
+        fixer = LiveSrtFixer(max_latency=60)
+        self.assertEqual(fixer.feed(YOUTUBE_VTT) + fixer.close(), expected)
+
+        fixer = LiveSrtFixer(max_latency=60)
+        chunks = [YOUTUBE_VTT[i:i + 7] for i in range(0, len(YOUTUBE_VTT), 7)]
+        self.assertEqual("".join(fixer.feed(chunk) for chunk in chunks) + fixer.close(), expected)
+
+    def test_late_subtitle_goes_out_before_merge(self):
+        now = [0]
+        fixer = LiveSrtFixer(max_latency=1, clock=lambda: now[0])
+        text = fixer.feed("1\n00:00:01,000 --> 00:00:02,000\nhello there friend\n\n"
+                          "2\n00:00:02,000 --> 00:00:03,000\nsomething else here\n\n"
+                          "3\n00:00:03,000 --> 00:00:04,000\nsomething else here\nOkay\n\n")
+        self.assertEqual(text.count("-->"), 2)
+
+        now[0] = 5  # Okay is overdue when the next cue arrives
+        text = fixer.feed("4\n00:00:04,000 --> 00:00:06,000\nOkay\nthis is the end\n\n")
+        self.assertEqual(text, "3\n00:00:03,000 --> 00:00:04,000\nOkay\n\n")
+        self.assertEqual(fixer.close(), "4\n00:00:04,000 --> 00:00:06,000\nthis is the end\n\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
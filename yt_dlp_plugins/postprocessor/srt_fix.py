@@ -4,7 +4,9 @@ from yt_dlp.postprocessor import FFmpegSubtitlesConvertorPP
 # start
 import re
 import os
+import bisect
 from datetime import timedelta
+from typing import Optional
 
 
 class Subtitle:
@@ -133,75 +135,188 @@ class SimpleSrt:
             else:
                 i += 1
 
-def dedupe_yt_srt(subs_iter):
+def dedupe_yt_action(previous_subtitle, subtitle):
+    """
+    Decides which dedupe rule of dedupe_yt_srt applies to a subtitle, without changing anything.
+    The decision only depends on the texts, so it can be reused for translations with the same timing.
+
+    :param previous_subtitle: the last subtitle that is not finished yet, None for the first subtitle
+    :param subtitle: the next subtitle, with stripped text
+    :return: one of "first", "skip", "extend", "append", "join", "cut" or "keep"
+    """
+    if previous_subtitle is None: # first interation set previous subtitle for comparison
+        return "first"
+
+    if len(subtitle.text) == 0:  # skip over empty subtitles
+        return "skip"
+
+    if (subtitle.start - subtitle.end < timedelta(milliseconds=150) and # very short
+                    subtitle.text in previous_subtitle.text ): # same text as previous
+        return "extend"
+
+    current_lines = subtitle.text.split("\n")
+    last_lines = previous_subtitle.text.split("\n")
+
+    if current_lines[0] == last_lines[-1]: # if first current is  last previous
+        if len(last_lines)==1 and len(last_lines[0].split(" "))<2 and len(last_lines[0])>2: # if  is just one word
+            return "join"
+        return "cut"
+
+    if len(subtitle.text.split(" "))<=2: # only one word in subtitle
+        return "append"
+    return "keep"
+
+
+def dedupe_yt_step(previous_subtitle, subtitle, action=None):
+    """
+    Applies the dedupe rules of dedupe_yt_srt to a single subtitle.
+    previous_subtitle and subtitle may both be modified.
+
+    :param previous_subtitle: the last subtitle that is not finished yet, None for the first subtitle
+    :param subtitle: the next subtitle
+    :param action: rule to apply as returned by dedupe_yt_action, decided from the texts if None
+    :return: tuple of the finished subtitle (or None) and the subtitle to compare the next one with
+    """
+    if previous_subtitle is None:
+        return None, subtitle
+
+    subtitle.text = subtitle.text.strip() # remove trailing linebreaks
+    if action is None:
+        action = dedupe_yt_action(previous_subtitle, subtitle)
+
+    if action == "skip":
+        return None, previous_subtitle
+
+    if action == "extend":
+        previous_subtitle.end = subtitle.end # lengthen previous subtitle
+        return None, previous_subtitle
+
+    if action == "append":
+        previous_subtitle.end = subtitle.end # lengthen previous subtitle
+        title_text=subtitle.text
+        if title_text[0]!=" ":
+            title_text=" "+title_text
+
+        previous_subtitle.text+=title_text # add text to previous
+        return None, previous_subtitle # drop this subtitle
+
+    current_lines = subtitle.text.split("\n")
+    if action == "join":
+        subtitle.text= current_lines[0]+" "+"\n".join(current_lines[1:]) # remove line break after single word
+    elif action == "cut":
+        subtitle.text = "\n".join(current_lines[1:]) # discard first line of current
+
+    if subtitle.start <= previous_subtitle.end: # remove overlap and let 1ms gap
+        previous_subtitle.end = subtitle.start - timedelta(milliseconds=1)
+
+    if subtitle.start >= subtitle.end: # swap start and end if wrong order
+        end =subtitle.end
+        subtitle.end= subtitle.start
+        subtitle.start = end
+
+    if action == "join": # previous single word is now the start of this subtitle
+        return None, subtitle
+    return previous_subtitle, subtitle
+
+
+def dedupe_yt_srt(subs_iter, actions=None):
+    """
+    Removes the rolling duplicate lines of YouTube auto generated subtitles and fixes their timing.
+
+    :param subs_iter: iterable of Subtitle objects
+    :param actions: list the decided dedupe_yt_action of every subtitle is appended to, for replay_yt_texts
+    :return: generator of the fixed Subtitle objects
+    """
     previous_subtitle = None
-    index = 1
-    text = ""
     for subtitle in subs_iter:
+        if previous_subtitle is not None:
+            subtitle.text = subtitle.text.strip() # remove trailing linebreaks
+        action = dedupe_yt_action(previous_subtitle, subtitle)
+        if actions is not None:
+            actions.append(action)
+        finished_subtitle, previous_subtitle = dedupe_yt_step(previous_subtitle, subtitle, action)
+        if finished_subtitle is not None:
+            yield finished_subtitle
+    if previous_subtitle is not None:
+        yield previous_subtitle
 
 
-        if previous_subtitle is None: # first interation set previous subtitle for comparison
-             previous_subtitle = subtitle
-             continue
-
-        subtitle.text = subtitle.text.strip() # remove trailing linebreaks
+srt_cue_pattern = re.compile(r"^[ \t]*(\d+:\d+:\d+,\d+ --> \d+:\d+:\d+,\d+)[^\n]*", re.MULTILINE)
 
 
+def split_srt_cues(subtitle_text):
+    """
+    Splits srt text into the timecode lines and the texts of the cues, like SimpleSrt without parsing the times.
 
-        if len(subtitle.text) == 0:  # skip over empty subtitles
+    :param subtitle_text: srt text
+    :return: tuple of the list of timecode strings and the list of stripped cue texts
+    """
+    matches = list(srt_cue_pattern.finditer(subtitle_text))
+    timecodes = [match.group(1) for match in matches]
+    texts = []
+    for i, match in enumerate(matches):
+        last = i + 1 == len(matches)
+        block = subtitle_text[match.end():len(subtitle_text) if last else matches[i + 1].start()]
+        lines = [x for x in block.split("\n") if len(x.strip()) > 0]
+        if not last:
+            lines = lines[:-1]  # index of the next cue
+        texts.append("\n".join(lines).strip())
+    return timecodes, texts
+
+
+def replay_yt_texts(texts, actions):
+    """
+    Applies the actions dedupe_yt_srt recorded for another track with the same timing to the texts of a track,
+    like the automatic translations of YouTube subtitles. Only the texts are handled, the fixed timing
+    is the one of the other track.
+    Raises ValueError if a text doesn't fit its action, the track has to be fixed on its own then.
+
+    :param texts: cue texts as returned by split_srt_cues
+    :param actions: list of actions recorded by dedupe_yt_srt
+    :return: list of the fixed texts, one for every subtitle dedupe_yt_srt returned for the other track
+    """
+    if len(texts) != len(actions):
+        raise ValueError("number of subtitles and recorded actions differ")
+
+    fixed_texts = []
+    previous_text = None
+    for text, action in zip(texts, actions):
+        if action == "first":
+            previous_text = text
             continue
 
-        if (subtitle.start - subtitle.end < timedelta(milliseconds=150) and # very short
-                        subtitle.text in previous_subtitle.text ): # same text as previous
-            previous_subtitle.end = subtitle.end # lengthen previous subtitle
+        if action == "skip":
+            if len(text) > 0:
+                raise ValueError(f"'{text}' is not empty")
             continue
-        
-
-     
-        
 
+        if action == "extend":
+            if text not in previous_text:
+                raise ValueError(f"'{text}' is not part of '{previous_text}'")
+            continue
 
-        current_lines = subtitle.text.split("\n")
-        last_lines = previous_subtitle.text.split("\n")
+        if action == "append":
+            if len(text) == 0:
+                raise ValueError(f"can't append an empty subtitle to '{previous_text}'")
+            previous_text += " " + text
+            continue
 
-        singleword=False
+        current_lines = text.split("\n")
+        if action in ("cut", "join"):
+            if current_lines[0] != previous_text.split("\n")[-1]:
+                raise ValueError(f"'{current_lines[0]}' doesn't repeat the last line of '{previous_text}'")
+            if action == "cut":
+                text = "\n".join(current_lines[1:])
+            else:
+                text = current_lines[0] + " " + "\n".join(current_lines[1:])
 
-        if current_lines[0] == last_lines[-1]: # if first current is  last previous
-            if len(last_lines)==1:
-                if  len(last_lines[0].split(" "))<2 and len(last_lines[0])>2: # if  is just one word            
-                    singleword=True
-                    subtitle.text= current_lines[0]+" "+"\n".join(current_lines[1:]) # remove line break after single word
-  
-                else:
-                    subtitle.text = "\n".join(current_lines[1:]) # discard first line of current            
-            else:        
-                subtitle.text = "\n".join(current_lines[1:]) # discard first line of current
-        else: # not fusing two lines
-            if len(subtitle.text.split(" "))<=2: # only one word in subtitle
-         
-                previous_subtitle.end = subtitle.end # lengthen previous subtitle
-                title_text=subtitle.text
-                if title_text[0]!=" ":
-                    title_text=" "+title_text
-
-                previous_subtitle.text+=title_text # add text to previous
-                continue # drop this subtitle
-
-
-        if subtitle.start <= previous_subtitle.end: # remove overlap and let 1ms gap
-            previous_subtitle.end = subtitle.start - timedelta(milliseconds=1)
-
-        if subtitle.start >= subtitle.end: # swap start and end if wrong order
-            end =subtitle.end 
-            subtitle.end= subtitle.start
-            subtitle.start = end
-            
+        if action != "join":
+            fixed_texts.append(previous_text)
+        previous_text = text
 
-        if not singleword:
-            yield previous_subtitle
-        previous_subtitle = subtitle
-        index += 1
-    yield previous_subtitle
+    if previous_text is not None:
+        fixed_texts.append(previous_text)
+    return fixed_texts
 
 
 def subs_to_text(subs_iter):
@@ -216,16 +331,180 @@ def subs_to_text(subs_iter):
 
     return text
 
-def process_srt(file_path, new_file_path):
-    text = ""
-    with open(file_path, "r", encoding="utf8") as file:
-        srtstring = file.read()
-        srt = SimpleSrt(srtstring)
-        subs = dedupe_yt_srt(srt.subs)
-        text=subs_to_text(subs)
+
+yt_timecode_pattern = r"(\d+):(\d+):(\d+)[,.](\d+) --> (\d+):(\d+):(\d+)[,.](\d+)"
+yt_timecode_patterns = {str: re.compile(yt_timecode_pattern), bytes: re.compile(yt_timecode_pattern.encode())}
+
+
+def _first_and_last_line(text, newline):
+    lines = [line.strip() for line in text.split(newline)]
+    lines = [line for line in lines if line]
+    if lines and lines[-1].isdigit():  # index of the next cue
+        lines.pop()
+    if not lines:
+        return None, None
+    return lines[0], lines[-1]
+
+
+def _scan_cues(data):
+    # yields start and end in ms, first and last text line of every cue, without building Subtitle objects
+    pattern = yt_timecode_patterns[type(data)]
+    newline = b"\n" if isinstance(data, bytes) else "\n"
+    cue = None  # start, end and text position of the last timecode
+    for match in pattern.finditer(data):
+        if cue:
+            yield (cue[0], cue[1]) + _first_and_last_line(data[cue[2]:match.start()], newline)
+        h1, m1, s1, ms1, h2, m2, s2, ms2 = [int(x) for x in match.groups()]
+        cue = ((h1 * 3600 + m1 * 60 + s1) * 1000 + ms1, (h2 * 3600 + m2 * 60 + s2) * 1000 + ms2, match.end())
+    if cue:
+        yield (cue[0], cue[1]) + _first_and_last_line(data[cue[2]:], newline)
+
+
+def scan_yt_srt(data, min_hits=2):
+    """
+    Checks the raw subtitle text for the signatures of YouTube auto generated subtitles:
+    cues of about 10ms, the first line of a cue repeating the last line of the previous cue
+    and overlapping timecodes. Stops as soon as min_hits signatures are found.
+
+    :param data: srt text as str or bytes
+    :param min_hits: number of signatures needed to consider the subtitles broken
+    :return: True if the subtitles need fixing, False if they are clean
+    """
+    hits = 0
+    previous_end = None
+    previous_last_line = None
+    for start, end, first_line, last_line in _scan_cues(data):
+        if end - start <= 50:  # very short
+            hits += 1
+        if previous_end is not None and start < previous_end:  # overlap
+            hits += 1
+        if first_line is not None and first_line == previous_last_line:  # rolling duplicate line
+            hits += 1
+        if hits >= min_hits:
+            return True
+        previous_end = end
+        previous_last_line = last_line
+    return False
+
+
+def _to_ms(duration: timedelta) -> int:
+    return duration // timedelta(milliseconds=1)
+
+
+class SubtitleTrack:
+    """
+        A time-indexed list of subtitles for fast lookups and clip extraction.
+
+        Build it once from the output of dedupe_yt_srt, then cut as many clips as needed.
+        Every lookup is a bisect on the sorted start times, so a clip costs O(log n + k)
+        instead of a full pass over the subtitles.
+
+        Attributes
+        ----------
+        subs : List[Subtitle]
+            The subtitles sorted by start time.
+
+        Methods
+        -------
+        at(t_ms: int) -> Union[Subtitle, None]:
+            Returns the subtitle shown at t_ms milliseconds, or None.
+
+        slice(start_ms: int, end_ms: Optional[int], rebase: bool = True) -> List[Subtitle]:
+            Returns the subtitles overlapping the clip from start_ms to end_ms (None for the end of the track),
+            with times rebased to the clip start if rebase is True.
+
+        Usage
+        -----
+        track = SubtitleTrack(dedupe_yt_srt(SimpleSrt(srt_string).subs))
+        clip = subs_to_text(track.slice(60000, 90000))
+    """
+
+    def __init__(self, subs_iter):
+        self.subs = sorted((subtitle for subtitle in subs_iter if subtitle is not None), key=lambda subtitle: subtitle.start)
+        self._starts = [_to_ms(subtitle.start) for subtitle in self.subs]
+
+        # running maximum of the end times, sorted even if some subtitles overlap
+        self._max_ends = []
+        max_end = None
+        for subtitle in self.subs:
+            end = _to_ms(subtitle.end)
+            if max_end is None or end > max_end:
+                max_end = end
+            self._max_ends.append(max_end)
+
+    def __len__(self) -> int:
+        return len(self.subs)
+
+    def __iter__(self):
+        return iter(self.subs)
+
+    def at(self, t_ms: int):
+        """
+        Returns the subtitle shown at t_ms milliseconds, or None if there is none.
+        If several subtitles overlap t_ms, the one that started last is returned.
+
+        :param t_ms: time in milliseconds
+        :return: Subtitle or None
+        """
+        i = bisect.bisect_right(self._starts, t_ms)
+        lowest = bisect.bisect_right(self._max_ends, t_ms)
+        while i > lowest:
+            i -= 1
+            if _to_ms(self.subs[i].end) > t_ms:
+                return self.subs[i]
+        return None
+
+    def slice(self, start_ms: int, end_ms: Optional[int], rebase: bool = True):
+        """
+        Returns the subtitles overlapping the clip from start_ms to end_ms, or to the end of the track if end_ms is None.
+        With rebase the returned subtitles are copies whose times are relative to start_ms
+        and clamped to the clip, the subtitles of the track are never modified.
+
+        :param start_ms: clip start in milliseconds
+        :param end_ms: clip end in milliseconds, None for the end of the track
+        :param rebase: shift the times so the clip starts at 0
+        :return: list of Subtitle objects
+        """
+        lo = bisect.bisect_right(self._max_ends, start_ms)
+        hi = len(self.subs) if end_ms is None else bisect.bisect_left(self._starts, end_ms)
+        clip = [subtitle for subtitle in self.subs[lo:hi] if _to_ms(subtitle.end) > start_ms]
+        if not rebase:
+            return clip
+
+        offset = timedelta(milliseconds=start_ms)
+        length = None if end_ms is None else timedelta(milliseconds=end_ms - start_ms)
+        return [Subtitle(max(subtitle.start - offset, timedelta(0)),
+                         subtitle.end - offset if length is None else min(subtitle.end - offset, length),
+                         subtitle.text)
+                for subtitle in clip]
+
+
+def process_srt(file_path, new_file_path, skip_clean=False):
+    """
+    Fixes a srt file and saves it as new_file_path.
+
+    :param file_path: srt file to fix
+    :param new_file_path: path of the fixed srt file
+    :param skip_clean: copy files without YouTube duplicates unchanged instead of fixing them
+    :return: True if the file was fixed, False if it was copied unchanged
+    """
+    with open(file_path, "rb") as file:
+        data = file.read()
+
+    if skip_clean and not scan_yt_srt(data):
+        with open(new_file_path, "wb") as new_file:
+            new_file.write(data)
+        return False
+
+    srtstring = data.decode("utf8").replace("\r\n", "\n").replace("\r", "\n")
+    srt = SimpleSrt(srtstring)
+    subs = dedupe_yt_srt(srt.subs)
+    text=subs_to_text(subs)
 
     with open(new_file_path, "w", encoding="utf8") as new_file:
         new_file.write(text.strip())
+    return True
+
 
 # ℹ️ See the docstring of yt_dlp.postprocessor.common.PostProcessor
 
@@ -242,8 +521,63 @@ class srt_fixPP(PostProcessor):
         # Also, "downloader", "when" and "key" are reserved names
         super().__init__(downloader)
         self._kwargs = kwargs
+        self._sections = self._parse_sections(kwargs.get('sections', ''))
+        self._skip_clean = kwargs.get('skip_clean', '').lower() in ('1', 'true', 'yes')
+
+    @staticmethod
+    def _section_ms(start: float, end: float):
+        # returns start and end in ms, end is None for the end of the track, or None for an invalid range
+        if not 0 <= start < end:
+            return None
+        if end == float('inf'):
+            return int(start * 1000), None
+        return int(start * 1000), int(end * 1000)
+
+    def _parse_sections(self, sections: str):
+        # sections=60-90,120-150.5,300-inf in seconds
+        parsed = []
+        for section in sections.split(','):
+            if not section.strip():
+                continue
+            try:
+                start, end = (float(x) for x in section.split('-'))
+            except ValueError:
+                start, end = -1, -1
+            section_ms = self._section_ms(start, end)
+            if section_ms is None:
+                self.report_warning(f'ignoring section "{section}", use start-end in seconds with start < end, like 60-90 or 300-inf')
+                continue
+            parsed.append(section_ms)
+        return parsed
+
+    def _requested_sections(self, info):
+        sections = list(self._sections)
+        if info.get('section_start') is not None and info.get('section_end') is not None:  # --download-sections
+            section_ms = self._section_ms(info['section_start'], info['section_end'])
+            if section_ms is None:
+                self.report_warning(f'ignoring section {info["section_start"]}-{info["section_end"]}')
+            else:
+                sections.append(section_ms)
+        return sections
+
+    @staticmethod
+    def _section_name(start_ms: int, end_ms):
+        return f'{start_ms / 1000:g}-{"inf" if end_ms is None else f"{end_ms / 1000:g}"}'
 
 
+    @staticmethod
+    def _with_text(subtitle: Subtitle, text: str) -> Subtitle:
+        # the fixed timing of the source track with the text of a translation
+        translated = Subtitle(subtitle.start, subtitle.end, "")
+        translated.text = text
+        return translated
+
+    @staticmethod
+    def _source_first(subtitles, info):
+        # automatic translations share the timing of the original track, fix that one first
+        source_lang = next((lang for lang in subtitles if lang.endswith('-orig')), info.get('language'))
+        return sorted(subtitles, key=lambda lang: lang != source_lang)
+
     def process_all(self, filepath):
         # self.to_screen(f'Postprocessing {filepath}')
         rawname = os.path.splitext(filepath)[0]  # filename without extension as this is videofile
@@ -251,8 +585,10 @@ class srt_fixPP(PostProcessor):
             if file.endswith(".srt") and rawname in file:  # finding srt file
                 newfile = file[:-4] + ".fixed.srt"
                 if not os.path.isfile(newfile):
-                    process_srt(file, newfile)
-                    self.to_screen(f'applied srt_fix to {file} saved as {rawname + ".fixed.srt"}')
+                    if process_srt(file, newfile, self._skip_clean):
+                        self.to_screen(f'applied srt_fix to {file} saved as {rawname + ".fixed.srt"}')
+                    else:
+                        self.to_screen(f'skipped srt_fix of {file}: no YouTube duplicates, copied unchanged to {newfile}')
                 else:
                     self.to_screen(f'skipped srt_fix of {file}: {newfile} exists')
     
@@ -267,8 +603,11 @@ class srt_fixPP(PostProcessor):
         #self.to_screen(f'Postprocessing {info}')
         
         modified_subtitles = {}
+        sections = self._requested_sections(info)
+        source = None  # timecodes, dedupe actions and result of the first fixed track, reused for its translations
         
-        for lang, sub_info in subtitles.items():
+        for lang in self._source_first(subtitles, info):
+            sub_info = subtitles[lang]
             if sub_info['ext'] not in self.SUPPORTED_EXTS:
                 continue
                 #self.to_screen(f'Subtitles can only be postprocessed in for these formats: {", ".join(self.SUPPORTED_EXTS)}')
@@ -289,14 +628,40 @@ class srt_fixPP(PostProcessor):
             if not subtitle_data:
                 continue
             
-            srt = SimpleSrt(subtitle_data)
-            subs = dedupe_yt_srt(srt.subs)
-            text=subs_to_text(subs)     
+            if self._skip_clean and not scan_yt_srt(subtitle_data):
+                self.to_screen(f'skipped srt_fix of {lang}: no YouTube duplicates, copied unchanged')
+                fixed_subs = SimpleSrt(subtitle_data).subs if sections else []
+                text = subtitle_data
+            else:
+                timecodes, texts = split_srt_cues(subtitle_data)
+                fixed_subs = None
+                if source is not None and timecodes == source['timecodes']:
+                    try:
+                        fixed_texts = replay_yt_texts(texts, source['actions'])
+                        fixed_subs = [self._with_text(subtitle, text) for subtitle, text in zip(source['subs'], fixed_texts)]
+                        self.to_screen(f'reused timing of {source["lang"]} for {lang}')
+                    except ValueError as error:  # texts don't fit, fix independently
+                        self.to_screen(f'fixing {lang} on its own: {error}')
+                if fixed_subs is None:
+                    actions = []
+                    fixed_subs = list(dedupe_yt_srt(SimpleSrt(subtitle_data).subs, actions))
+                    if source is None and len(timecodes) == len(actions):
+                        source = {'lang': lang, 'timecodes': timecodes, 'actions': actions, 'subs': fixed_subs}
+
+                text=subs_to_text(fixed_subs)
             
             sub_info['data'] = text
             modified_subtitles[lang] = sub_info
             with open(original_filepath[:-4]+".srt","w",encoding="utf-8") as f:
                 f.write(text)
+
+            track = SubtitleTrack(fixed_subs) if sections else None  # built once, sliced for every section
+            for start_ms, end_ms in sections:
+                section_name = self._section_name(start_ms, end_ms)
+                section_filepath = original_filepath[:-4] + f".{section_name}.srt"
+                with open(section_filepath, "w", encoding="utf-8") as f:
+                    f.write(subs_to_text(track.slice(start_ms, end_ms)))
+                self.to_screen(f'saved section {section_name} as {section_filepath}')
             
         subtitles.update(modified_subtitles) # Merge
         